@@ -5,7 +5,8 @@ coast lines that are not closed.
 """
 import sys
 import argparse
-import psycopg2
+from harn_db import connect, prepare, execute, temp_table, \
+    make_endpoints, update_endpoints, delete_endpoints, longest_paths, ring_tree
 
 EPSL = 0.004 # distance considered connected
 EPSB = 0.004 # buffer radius to weed out rivers
@@ -13,31 +14,26 @@ EPSB = 0.004 # buffer radius to weed out rivers
 def shortest_connect(table, cursor, line_id):
     """
     Returns the id of the closest line, the type, the geometry of it,
-    of the original line, and of the connecting line.
+    of the original line, and of the connecting line.  Candidates come
+    from a KNN lookup in the endpoints table {table}_ends.
     """
-    cursor.execute(f"""
-        SELECT wkb_geometry FROM {table} WHERE id = {line_id}""")
-    line_geo = cursor.fetchall()[0][0]
-    p_11 = f"(1, ST_StartPoint('{line_geo}'::geometry))"
-    p_12 = f"(2, ST_EndPoint('{line_geo}'::geometry))"
-    p_21 = f"(1, ST_StartPoint(main.wkb_geometry))"
-    p_22 = f"(2, ST_EndPoint(main.wkb_geometry))"
-    cursor.execute(f"""
-        SELECT add_id, add_type, add_geo, line_geo, connect_geo FROM (
-          SELECT main.id, main.type, main.wkb_geometry, '{line_geo}', (
-            WITH pts1 (i, p) AS (VALUES {p_11}, {p_12}), 
-              pts2 (i, p) AS (VALUES {p_21}, {p_22})
-            SELECT ST_MakeLine(pt1.p, pt2.p) FROM pts1 AS pt1 CROSS JOIN pts2 AS pt2
-            WHERE (main.id <> {line_id} OR pt1.i <> pt2.i)
-            ORDER BY ST_Distance(pt1.p, pt2.p) ASC LIMIT 1) AS connect
-          FROM {table} AS main)
-          AS connects (add_id, add_type, add_geo, line_geo, connect_geo)
-        WHERE ST_Length(connects.connect_geo) < {EPSL} AND
-          (connects.add_type LIKE '%COASTLINE%' OR
-            connects.add_type = '0')
-        ORDER BY ST_Length(connects.connect_geo) ASC LIMIT 1""")
-    ret = cursor.fetchall()
-    return ret
+    prepare(cursor, 'shortest_connect', f"""
+        SELECT main.id, main.type, main.wkb_geometry, line.wkb_geometry, near.connect_geo
+        FROM (
+          SELECT pt2.id, ST_MakeLine(pt1.geom, pt2.geom)
+          FROM {table}_ends AS pt1 CROSS JOIN LATERAL (
+            SELECT ends.id, ends.geom FROM {table}_ends AS ends
+            WHERE (ends.id <> pt1.id OR ends.end_i <> pt1.end_i) AND
+              (ends.type LIKE '%COASTLINE%' OR ends.type = '0') AND
+              ST_DWithin(ends.geom, pt1.geom, {EPSL})
+            ORDER BY ends.geom <-> pt1.geom ASC LIMIT 1)
+          AS pt2
+          WHERE pt1.id = $1 AND ST_Distance(pt1.geom, pt2.geom) < {EPSL}
+          ORDER BY ST_Distance(pt1.geom, pt2.geom) ASC LIMIT 1)
+          AS near (id, connect_geo)
+        JOIN {table} AS main ON main.id = near.id
+        JOIN {table} AS line ON line.id = $1""", ['integer'])
+    return execute(cursor, 'shortest_connect', line_id)
 
 def verbosity(verb, out):
     """Verbosity."""
@@ -55,53 +51,29 @@ def extract_lake(table, cursor, name, height, inner_point):
 
 def make_valid_polys(table, cursor, merge, line_id):
     """Removes the smallest segments until only disjoint polygons remain. Update."""
-    multi_polys = True
-    while multi_polys:
-        sql_array = "'" + "'::geometry, '".join(merge) + "'::geometry"
-        cursor.execute(f"""
-            SELECT geo, ST_Length(geo) FROM (
-              SELECT (ST_Dump(ST_LineMerge(ST_Union(ARRAY[{sql_array}])))).geom)
-            AS lines (geo) ORDER BY ST_Length(geo) DESC""")
-        merge = cursor.fetchall()
-        if merge[-1][1] > EPSL:
-            break
-        merge = [m[0] for m in merge[:-1]]
-
+    merge = longest_paths(merge, EPSL)
     if len(merge) == 1:
         cursor.execute(f"""
             UPDATE {table}
             SET name = 'nameless',
               type = '/COASTLINE/tmp-lake',
-              wkb_geometry = '{merge[0][0]}'::geometry
-            WHERE id = {line_id}""")
+              wkb_geometry = %s
+            WHERE id = %s""", (merge[0], line_id))
     else:
-        for poly in merge:
-            cursor.execute(f"""
-                INSERT INTO {table} (id, name, type, wkb_geometry)
-                VALUES (
-                  nextval('serial'), 'nameless', '/COASTLINE/tmp-lake',
-                  '{poly[0]}'::geometry)""")
         cursor.execute(f"""
-            DELETE FROM {table} WHERE id = {line_id}""")
+            INSERT INTO {table} (id, name, type, wkb_geometry)
+            SELECT nextval('serial'), 'nameless', '/COASTLINE/tmp-lake', geo
+            FROM unnest(%s::geometry[]) AS polys (geo)""", (merge,))
+        cursor.execute(f"""
+            DELETE FROM {table} WHERE id = %s""", (line_id,))
 
 def make_valid_line(table, cursor, merge, line_id):
     """Removes the smallest segments until a single line remains. Update."""
-    multi_line = True
-    while multi_line:
-        sql_array = "'" + "'::geometry, '".join(merge) + "'::geometry"
-        cursor.execute(f"""
-            SELECT geo FROM (
-              SELECT (ST_Dump(ST_LineMerge(ST_Union(ARRAY[{sql_array}])))).geom)
-            AS lines (geo) ORDER BY ST_Length(geo) DESC""")
-        merge = cursor.fetchall()
-        if len(merge) == 1:
-            break
-        merge = [m[0] for m in merge[:-1]]
-
-    cursor.execute(f"""
+    prepare(cursor, 'set_line', f"""
         UPDATE {table}
-        SET wkb_geometry = '{merge[0][0]}'::geometry
-        WHERE id = {line_id}""")
+        SET wkb_geometry = $2
+        WHERE id = $1""", ['integer', 'geometry'])
+    execute(cursor, 'set_line', line_id, longest_paths(merge)[0])
 
 def main():
     """Main method."""
@@ -119,12 +91,7 @@ def main():
         help='verbose', required=False)
     args = parser.parse_args()
 
-    conn = psycopg2.connect(
-        user=f"{args.db.split('@')[0].split(':')[0]}",
-        password=f"{args.db.split('@')[0].split(':')[1]}",
-        database=f"{args.db.split('@')[1].split(':')[0]}",
-        host=f"{args.db.split('@')[1].split(':')[1]}",
-        port=f"{args.db.split('@')[1].split(':')[2]}")
+    conn = connect(args.db)
     cursor = conn.cursor()
 
     # Initialize
@@ -144,8 +111,12 @@ def main():
     cursor.execute(f"""
         SELECT id, wkb_geometry FROM {args.table}_lines WHERE type LIKE '%COASTLINE%'""")
     lines = cursor.fetchall()
-    for line in lines:
-        make_valid_line(f"{args.table}_lines", cursor, [line[1]], line[0])
+    valid = [longest_paths([line[1]])[0] for line in lines]
+    cursor.execute(f"""
+        UPDATE {args.table}_lines AS tl
+        SET wkb_geometry = valid.geo
+        FROM unnest(%s::integer[], %s::geometry[]) AS valid (id, geo)
+        WHERE tl.id = valid.id""", ([line[0] for line in lines], valid))
 
     # Connect
     print("Connect unlabeled and like-labelled lines")
@@ -154,22 +125,26 @@ def main():
         ORDER BY id""")
     lines = cursor.fetchall()
     deleted = []
+    make_endpoints(cursor, f"{args.table}_lines", "type LIKE '%COASTLINE%' OR type = '0'")
+    prepare(cursor, 'delete_line', f"""
+        DELETE FROM {args.table}_lines WHERE id = $1""", ['integer'])
 
     for line in lines:
         if line[0] in deleted:
             continue
         verbosity(args.verbose, f"- connect {line[0]}")
-        connect = shortest_connect(f"{args.table}_lines", cursor, line[0])
-        while len(connect) > 0:
-            verbosity(args.verbose, f"- - with {connect[0][0]}")
-            make_valid_line(f"{args.table}_lines", cursor, connect[0][2:], line[0])
-            if line[0] == connect[0][0]:
+        nearest = shortest_connect(f"{args.table}_lines", cursor, line[0])
+        while len(nearest) > 0:
+            verbosity(args.verbose, f"- - with {nearest[0][0]}")
+            make_valid_line(f"{args.table}_lines", cursor, nearest[0][2:], line[0])
+            update_endpoints(cursor, f"{args.table}_lines", line[0])
+            if line[0] == nearest[0][0]:
                 break
-            verbosity(args.verbose, f"- - remove {connect[0][0]}")
-            cursor.execute(f"""
-                DELETE FROM {args.table}_lines WHERE id = {connect[0][0]}""")
-            deleted.append(connect[0][0])
-            connect = shortest_connect(f"{args.table}_lines", cursor, line[0])
+            verbosity(args.verbose, f"- - remove {nearest[0][0]}")
+            execute(cursor, 'delete_line', nearest[0][0])
+            delete_endpoints(cursor, f"{args.table}_lines", nearest[0][0])
+            deleted.append(nearest[0][0])
+            nearest = shortest_connect(f"{args.table}_lines", cursor, line[0])
 
     # Islands
     print(f"Special: Melderyn Isle")
@@ -184,25 +159,27 @@ def main():
             ST_Covers(ST_MakePolygon(wkb_geometry), ST_GeomFromText('POINT(-15.3 40.33)')))
         AS lines (id, geo)""")
     poly = cursor.fetchall()
-    cursor.execute(f"""
+    temp_table(cursor, 'with_rivers', f"""
         SELECT wkb_geometry FROM {args.table}_lines WHERE id = {poly[0][0]}""")
-    with_rivers = cursor.fetchall()[0][0]
     verbosity(args.verbose, f"- {poly[0][0]}")
     make_valid_line(f"{args.table}_lines", cursor, [p[1] for p in poly], poly[0][0])
     cursor.execute(f"""
-        SELECT (ST_Dump(ST_Intersection(
-          ST_Buffer(ST_MakePolygon(wkb_geometry), -{EPSB}),
-          ST_Difference(ST_Buffer(ST_MakePolygon(wkb_geometry), {EPSB}),
-            ST_MakePolygon('{with_rivers}'::geometry))))).geom
-        FROM {args.table}_lines
-        WHERE id = {poly[0][0]}""")
-    for river in cursor.fetchall():
+        INSERT INTO {args.table}_lines (id, name, type, style, fill, wkb_geometry)
+        SELECT
+          nextval('serial'), 'temporary area river', '/STREAMS-LAKE/tmp-river', 'fill: #36868d',
+          '#36868d',
+          ST_ExteriorRing(river.geo)
+        FROM (
+          SELECT (ST_Dump(ST_Intersection(
+            ST_Buffer(ST_MakePolygon(tl.wkb_geometry), -{EPSB}),
+            ST_Difference(ST_Buffer(ST_MakePolygon(tl.wkb_geometry), {EPSB}),
+              ST_MakePolygon(wr.wkb_geometry))))).geom
+          FROM {args.table}_lines AS tl, with_rivers AS wr
+          WHERE tl.id = {poly[0][0]})
+        AS river (geo)
+        RETURNING id""")
+    for _ in cursor.fetchall():
         print(f"- new area river")
-        cursor.execute(f"""
-            INSERT INTO {args.table}_lines (id, name, type, style, wkb_geometry)
-            VALUES (
-              nextval('serial'), 'temporary area river', '/STREAMS-LAKE/tmp-river', 'fill: #36868d',
-              ST_ExteriorRing('{river[0]}'::geometry))""")
 
     # Lakes
     # Make smaller to "dry" rivers then bigger to create intersection with reality => take boundary
@@ -254,6 +231,12 @@ def main():
     cursor.execute(f"""
         SELECT count(*) FROM {args.table}_lines WHERE type LIKE '%COASTLINE%'""")
     print(f"Remaining lines: {cursor.fetchall()[0][0]}")
+
+    # Coasts changed, so refresh parent_id of the elevation rings
+    print("Update ring tree")
+    ring_tree(cursor, f"{args.table}_lines",
+              "type LIKE '%CONTOURS%' OR type LIKE '%00%' OR type LIKE '%COASTLINE%' OR " +
+              "type = '0'")
     conn.commit()
 
 if __name__ == '__main__':
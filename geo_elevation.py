@@ -6,100 +6,247 @@ heuristics for connected lines and rings.
 """
 import sys
 import argparse
-import psycopg2
+from harn_db import connect, prepare, execute, \
+    make_endpoints, update_endpoints, delete_endpoints, longest_paths, ring_tree
 
 EPSP = 0.0025
 EPSL = 0.007
+EPSS = 0.005 # vertex spacing sampled for the contour graph
+EPSG = 0.05 # longest gap between neighbouring contours
 
 def shortest_connect(table, cursor, line_id, line_type):
     """
     Returns the id of the closest line, the type, the geometry of it,
-    of the original line, and of the connecting line.
+    of the original line, and of the connecting line.  Candidates come
+    from a KNN lookup in the endpoints table {table}_ends.
     """
-    cursor.execute(f"""
-        SELECT wkb_geometry FROM {table} WHERE id = {line_id}""")
-    line_geo = cursor.fetchall()[0][0]
-    p_11 = f"(1, ST_StartPoint('{line_geo}'::geometry))"
-    p_12 = f"(2, ST_EndPoint('{line_geo}'::geometry))"
-    p_21 = f"(1, ST_StartPoint(main.wkb_geometry))"
-    p_22 = f"(2, ST_EndPoint(main.wkb_geometry))"
-    cursor.execute(f"""
-        SELECT add_id, add_type, add_geo, line_geo, connect_geo FROM (
-          SELECT main.id, main.type, main.wkb_geometry, '{line_geo}', (
-            WITH pts1 (i, p) AS (VALUES {p_11}, {p_12}), 
-              pts2 (i, p) AS (VALUES {p_21}, {p_22})
-            SELECT ST_MakeLine(pt1.p, pt2.p) FROM pts1 AS pt1 CROSS JOIN pts2 AS pt2
-            WHERE (main.id <> {line_id} OR pt1.i <> pt2.i)
-            ORDER BY ST_Distance(pt1.p, pt2.p) ASC LIMIT 1) AS connect
-          FROM {table} AS main)
-          AS connects (add_id, add_type, add_geo, line_geo, connect_geo)
-        WHERE ST_Length(connects.connect_geo) < {EPSL} AND
-          (connects.add_type LIKE '%CONTOURS%' OR
-            connects.add_type = '{line_type}')
-        ORDER BY ST_Length(connects.connect_geo) ASC LIMIT 1""")
-    ret = cursor.fetchall()
-    return ret
+    prepare(cursor, 'shortest_connect', f"""
+        SELECT main.id, main.type, main.wkb_geometry, line.wkb_geometry, near.connect_geo
+        FROM (
+          SELECT pt2.id, ST_MakeLine(pt1.geom, pt2.geom)
+          FROM {table}_ends AS pt1 CROSS JOIN LATERAL (
+            SELECT ends.id, ends.geom FROM {table}_ends AS ends
+            WHERE (ends.id <> pt1.id OR ends.end_i <> pt1.end_i) AND
+              (ends.type LIKE '%CONTOURS%' OR ends.type = $2) AND
+              ST_DWithin(ends.geom, pt1.geom, {EPSL})
+            ORDER BY ends.geom <-> pt1.geom ASC LIMIT 1)
+          AS pt2
+          WHERE pt1.id = $1 AND ST_Distance(pt1.geom, pt2.geom) < {EPSL}
+          ORDER BY ST_Distance(pt1.geom, pt2.geom) ASC LIMIT 1)
+          AS near (id, connect_geo)
+        JOIN {table} AS main ON main.id = near.id
+        JOIN {table} AS line ON line.id = $1""", ['integer', 'text'])
+    return execute(cursor, 'shortest_connect', line_id, line_type)
 
 def make_valid(table, cursor, merge, line_id):
     """Removes the smallest segments until a single line remains. Update."""
-    multi_line = True
-    while multi_line:
-        sql_array = "'" + "'::geometry, '".join(merge) + "'::geometry"
-        cursor.execute(f"""
-            SELECT geo FROM (
-              SELECT (ST_Dump(ST_LineMerge(ST_Union(ARRAY[{sql_array}])))).geom)
-            AS lines (geo) ORDER BY ST_Length(geo) DESC""")
-        merge = cursor.fetchall()
-        if len(merge) == 1:
-            break
-        merge = [m[0] for m in merge[:-1]]
+    prepare(cursor, 'set_line', f"""
+        UPDATE {table}
+        SET wkb_geometry = $2
+        WHERE id = $1""", ['integer', 'geometry'])
+    execute(cursor, 'set_line', line_id, longest_paths(merge)[0])
 
+def match_labels(verbose, table, cursor):
+    """
+    Give every contour the elevation of most height labels within EPSP,
+    ties going to the closest label.  Update and report contours with
+    labels of more than one elevation close.
+    """
     cursor.execute(f"""
-        UPDATE {table}
-        SET wkb_geometry = '{merge[0][0]}'::geometry
-        WHERE id = {line_id}""")
-
-def sort_elevation_pts(table, cursor):
-    """Sort all elevation points to their elevation."""
-    cursor.execute(f"""
-        SELECT substring(type, '[^1-9]([1-9][05]|5)00') AS elev,
-          ST_Union(wkb_geometry)
-        FROM {table}
-        WHERE type LIKE '%00%'
-        GROUP BY elev""")
-    points = cursor.fetchall()
-    elevsets = ""
-    for pt_i in points:
-        elevsets += f"({pt_i[0]}, '{pt_i[1]}'::geometry),"
-    return elevsets
-
-def label_rings(verbose, table, cursor, line):
-    """Label all unlabeled rings and check some incident labeled ones."""
-    if verbose:
-        print(f"- ring {line[0]}")
-    cursor.execute(f"""
-        SELECT id, type FROM {table}
-        WHERE (type LIKE '%CONTOURS%' OR type LIKE '%00%') AND
-          CASE WHEN ST_IsClosed(wkb_geometry) THEN
-            ST_Covers(ST_MakePolygon(wkb_geometry), '{line[1]}'::geometry)
-          END
-        ORDER BY ST_Distance(wkb_geometry, '{line[1]}'::geometry) ASC""")
-    rings = list(enumerate(cursor.fetchall()))
-    for idx_r, ring in rings:
-        if "00" not in ring[1]:
-            continue
+        WITH votes (id, elev, n, dist) AS (
+          SELECT tl.id, pts.elev, count(*), min(tl.wkb_geometry <-> pts.wkb_geometry)
+          FROM {table}_lines AS tl JOIN (
+            SELECT substring(type, '[^1-9]([1-9][05]|5)00'), wkb_geometry
+            FROM {table}_pts
+            WHERE type LIKE '%00%' AND type NOT LIKE '%/text')
+          AS pts (elev, wkb_geometry)
+          ON ST_DWithin(tl.wkb_geometry, pts.wkb_geometry, {EPSP})
+          WHERE tl.type LIKE '%CONTOURS%' AND pts.elev IS NOT NULL
+          GROUP BY tl.id, pts.elev),
+        ranked AS (
+          SELECT id, elev, n,
+            row_number() OVER (PARTITION BY id ORDER BY n DESC, dist ASC) AS pos,
+            count(*) OVER (PARTITION BY id) AS choices
+          FROM votes),
+        fixed AS (
+          UPDATE {table}_lines AS tl
+          SET type = ranked.elev || '00'
+          FROM ranked
+          WHERE tl.id = ranked.id AND ranked.pos = 1)
+        SELECT id, array_agg(elev || '00' ORDER BY pos), array_agg(n ORDER BY pos)
+        FROM ranked
+        WHERE choices > 1
+        GROUP BY id ORDER BY id""")
+    ambiguous = cursor.fetchall()
+    ties = [line for line in ambiguous if line[2][0] == line[2][1]]
+    print(f"Ambiguous lines: {len(ambiguous)}, tied: {len(ties)}")
+    for line in ambiguous:
+        if verbose or line in ties:
+            votes = ', '.join(f"{elev} x{n}" for elev, n in zip(line[1], line[2]))
+            print(f"- {line[0]}: {votes}")
+
+def label_rings(verbose, table, cursor, tops):
+    """
+    Label all unlabeled rings around the rings tops and check the
+    labeled ones on the way, walking up the parent_id tree.  Update.
+    """
+    cursor.execute(f"""
+        SELECT tl.id, tl.type, tl.parent_id FROM {table} AS tl JOIN {table}_rings USING (id)""")
+    tree = {ring[0]: ring[1:] for ring in cursor.fetchall()}
+    elevations = {}
+    for top in tops:
         if verbose:
-            print(f"- - found fixed {ring}")
-        for idx_c, check in rings:
-            elev = int(ring[1]) + 500*(idx_r - idx_c)
+            print(f"- ring {top}")
+        rings = []
+        ring = top
+        while ring is not None:
+            if "CONTOURS" in tree[ring][0] or "00" in tree[ring][0]:
+                rings.append((ring, tree[ring][0]))
+            ring = tree[ring][1]
+        rings = list(enumerate(rings))
+        for idx_r, ring in rings:
+            if "00" not in ring[1]:
+                continue
             if verbose:
-                print(f"- - - fix {check} with {elev}")
-            if f"{elev}" != check[1] and "CONTOURS" not in check[1]:
-                print(f"- - - erroneous fix {check} with {elev}")
-            cursor.execute(f"""
-                UPDATE {table}
-                SET elevation = {elev}
-                WHERE id = {check[0]} AND type LIKE '%CONTOURS%'""")
+                print(f"- - found fixed {ring}")
+            for idx_c, check in rings:
+                elev = int(ring[1]) + 500*(idx_r - idx_c)
+                if verbose:
+                    print(f"- - - fix {check} with {elev}")
+                if f"{elev}" != check[1] and "CONTOURS" not in check[1]:
+                    print(f"- - - erroneous fix {check} with {elev}")
+                elevations[check[0]] = elev
+    cursor.execute(f"""
+        UPDATE {table} AS tl
+        SET elevation = fix.elev
+        FROM unnest(%s::integer[], %s::integer[]) AS fix (id, elev)
+        WHERE tl.id = fix.id AND tl.type LIKE '%%CONTOURS%%'""",
+                   (list(elevations), list(elevations.values())))
+
+def contour_graph(lines):
+    """
+    Neighbours of the shapely lines, as a dict of sets of their indices,
+    from a Delaunay triangulation of points sampled every EPSS along
+    them.  Two lines are neighbours if at least two triangle edges
+    shorter than EPSG join them.
+    """
+    import numpy
+    import shapely
+    from scipy.spatial import Delaunay
+    lengths = shapely.length(lines)
+    counts = (lengths / EPSS).astype(int) + 2
+    index = numpy.repeat(numpy.arange(len(lines)), counts)
+    steps = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+    coords = shapely.get_coordinates(shapely.line_interpolate_point(
+        lines[index], steps * numpy.repeat(lengths / (counts - 1), counts)))
+    coords, first = numpy.unique(coords, axis=0, return_index=True)
+    index = index[first]
+    graph = {}
+    if len(coords) < 3:
+        return graph
+    simplices = Delaunay(coords).simplices.astype(numpy.int64)
+    edges = numpy.sort(numpy.concatenate(
+        [simplices[:, [0, 1]], simplices[:, [1, 2]], simplices[:, [2, 0]]]), axis=1)
+    edges = numpy.unique(edges[:, 0] * len(coords) + edges[:, 1])
+    edges = numpy.stack([edges // len(coords), edges % len(coords)], axis=1)
+    short = numpy.hypot(*(coords[edges[:, 0]] - coords[edges[:, 1]]).T) < EPSG
+    pairs = numpy.sort(index[edges[short]], axis=1)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    pairs, counts = numpy.unique(pairs[:, 0] * len(lines) + pairs[:, 1], return_counts=True)
+    for line_a, line_b in zip((pairs[counts >= 2] // len(lines)).tolist(),
+                              (pairs[counts >= 2] % len(lines)).tolist()):
+        graph.setdefault(line_a, set()).add(line_b)
+        graph.setdefault(line_b, set()).add(line_a)
+    return graph
+
+def steps_from(graph, group, sources):
+    """Graph distance within group from the nodes next to sources, starting at 1."""
+    steps = {node: 1 for node in group if graph[node] & sources}
+    todo = list(steps)
+    for node in todo:
+        for other in graph[node] & group:
+            if other not in steps:
+                steps[other] = steps[node] + 1
+                todo.append(other)
+    return steps
+
+def propagate(graph, elevations):
+    """
+    Elevations for the lines of graph not in elevations.  Each group of
+    connected unknown lines between known lines of exactly two
+    elevations low and high is set in 500ft steps by its distance from
+    the low ones, if every line of it is as many steps from both as the
+    elevations differ.  Returns the new elevations and the groups left.
+    """
+    found = {}
+    left = []
+    seen = set(elevations)
+    for start in graph:
+        if start in seen:
+            continue
+        group = {start}
+        todo = [start]
+        for node in todo:
+            for other in graph[node] - seen - group:
+                group.add(other)
+                todo.append(other)
+        seen |= group
+        known = {other for node in group for other in graph[node]} - group
+        levels = sorted({elevations[other] for other in known})
+        if len(levels) != 2 or (levels[1] - levels[0]) % 500 != 0:
+            left.append((group, levels))
+            continue
+        low = steps_from(graph, group, {other for other in known if elevations[other] == levels[0]})
+        high = steps_from(graph, group, {other for other in known if elevations[other] == levels[1]})
+        if any(node not in low or node not in high or
+               low[node] + high[node] != (levels[1] - levels[0]) // 500 for node in group):
+            left.append((group, levels))
+            continue
+        for node in group:
+            found[node] = levels[0] + 500 * low[node]
+    return found, left
+
+def propagate_elevations(verbose, table, cursor):
+    """
+    Propagate elevations to unlabeled contours over the contour graph
+    of all contours and coastlines (elevation 0).  Update and report
+    neighbours more than 500ft apart.
+    """
+    import shapely
+    cursor.execute(f"""
+        SELECT id, type, elevation, wkb_geometry FROM {table}
+        WHERE type LIKE '%CONTOURS%' OR type ~ '^[0-9]+00$' OR type LIKE '%COASTLINE%'""")
+    rows = cursor.fetchall()
+    elevations = {}
+    for idx, row in enumerate(rows):
+        if row[1].isdigit():
+            elevations[idx] = int(row[1])
+        elif "COASTLINE" in row[1]:
+            elevations[idx] = 0
+        elif row[2] is not None:
+            elevations[idx] = row[2]
+    graph = contour_graph(shapely.from_wkb([row[3] for row in rows]))
+    found, left = propagate(graph, elevations)
+    print(f"Propagated elevation to {len(found)} lines, " +
+          f"{sum(len(group) for group, _ in left)} lines in {len(left)} groups left")
+    if verbose:
+        for group, levels in left:
+            print(f"- {sorted(rows[node][0] for node in group)} between {levels}")
+    elevations.update(found)
+    conflicts = [(rows[line_a][0], rows[line_b][0])
+                 for line_a in graph for line_b in graph[line_a]
+                 if line_a < line_b and line_a in elevations and line_b in elevations and
+                 abs(elevations[line_a] - elevations[line_b]) > 500]
+    print(f"Neighbours more than 500ft apart: {len(conflicts)}")
+    if verbose:
+        for conflict in conflicts:
+            print(f"- {conflict}")
+    cursor.execute(f"""
+        UPDATE {table} AS tl
+        SET elevation = fix.elev
+        FROM unnest(%s::integer[], %s::integer[]) AS fix (id, elev)
+        WHERE tl.id = fix.id AND tl.type LIKE '%%CONTOURS%%'""",
+                   ([rows[node][0] for node in found], list(found.values())))
 
 def main():
     """Main method."""
@@ -117,18 +264,15 @@ def main():
         help='verbose', required=False)
     args = parser.parse_args()
 
-    conn = psycopg2.connect(
-        user=f"{args.db.split('@')[0].split(':')[0]}",
-        password=f"{args.db.split('@')[0].split(':')[1]}",
-        database=f"{args.db.split('@')[1].split(':')[0]}",
-        host=f"{args.db.split('@')[1].split(':')[1]}",
-        port=f"{args.db.split('@')[1].split(':')[2]}")
+    conn = connect(args.db)
     cursor = conn.cursor()
 
     # Initialize
     cursor.execute(f"""
         CREATE TEMP SEQUENCE IF NOT EXISTS serial START 400000;
         ALTER TABLE {args.table}_lines ALTER id SET NOT NULL;
+        ALTER TABLE {args.table}_lines ADD COLUMN IF NOT EXISTS elevation integer;
+        ALTER TABLE {args.table}_polys ADD COLUMN IF NOT EXISTS elevation integer;
         SELECT count(*) FROM {args.table}_lines WHERE type LIKE '%CONTOURS%'""")
     print(f"Identifying lines: {cursor.fetchall()[0][0]}")
 
@@ -153,20 +297,16 @@ def main():
     cursor.execute(f"""
         SELECT id, wkb_geometry FROM {args.table}_lines WHERE type LIKE '%CONTOURS%'""")
     lines = cursor.fetchall()
-    for line in lines:
-        make_valid(f"{args.table}_lines", cursor, [line[1]], line[0])
+    valid = [longest_paths([line[1]])[0] for line in lines]
+    cursor.execute(f"""
+        UPDATE {args.table}_lines AS tl
+        SET wkb_geometry = valid.geo
+        FROM unnest(%s::integer[], %s::geometry[]) AS valid (id, geo)
+        WHERE tl.id = valid.id""", ([line[0] for line in lines], valid))
 
     # Match labels and lines
     print("Matching height label to lines")
-    elevsets = sort_elevation_pts(f"{args.table}_pts", cursor)
-    cursor.execute(f"""
-        UPDATE {args.table}_lines
-        SET type = t3.b FROM (
-          WITH elev (idx, geom) AS (VALUES {elevsets[:-1]})
-          SELECT t1.id, t2.idx || '00' FROM {args.table}_lines AS t1 JOIN elev AS t2 ON TRUE
-          WHERE ST_Distance(t2.geom, t1.wkb_geometry) < {EPSP}
-          ORDER BY ST_Distance(t2.geom, t1.wkb_geometry)) AS t3 (a, b)
-        WHERE id = t3.a AND type LIKE '%CONTOURS%'""")
+    match_labels(args.verbose, args.table, cursor)
 
     cursor.execute(f"""
         SELECT count(*) FROM {args.table}_lines WHERE type LIKE '%CONTOURS%'""")
@@ -179,24 +319,28 @@ def main():
         WHERE type LIKE '%00%' AND NOT ST_IsClosed(wkb_geometry) ORDER BY id""")
     lines = cursor.fetchall()
     deleted = []
+    make_endpoints(cursor, f"{args.table}_lines", "type LIKE '%CONTOURS%' OR type LIKE '%00%'")
+    prepare(cursor, 'delete_line', f"""
+        DELETE FROM {args.table}_lines WHERE id = $1""", ['integer'])
     for line in lines:
         if line[0] in deleted:
             continue
         if args.verbose:
             print(f"- connect {line[0]}")
-        connect = shortest_connect(f"{args.table}_lines", cursor, line[0], line[1])
-        while len(connect) > 0:
+        nearest = shortest_connect(f"{args.table}_lines", cursor, line[0], line[1])
+        while len(nearest) > 0:
             if args.verbose:
-                print(f"- - with {connect[0][0]}")
-            make_valid(f"{args.table}_lines", cursor, connect[0][2:], line[0])
-            if line[0] == connect[0][0]:
+                print(f"- - with {nearest[0][0]}")
+            make_valid(f"{args.table}_lines", cursor, nearest[0][2:], line[0])
+            update_endpoints(cursor, f"{args.table}_lines", line[0])
+            if line[0] == nearest[0][0]:
                 break
             if args.verbose:
-                print(f"- - remove {connect[0][0]}")
-            cursor.execute(f"""
-                DELETE FROM {args.table}_lines WHERE id = {connect[0][0]}""")
-            deleted.append(connect[0][0])
-            connect = shortest_connect(f"{args.table}_lines", cursor, line[0], line[1])
+                print(f"- - remove {nearest[0][0]}")
+            execute(cursor, 'delete_line', nearest[0][0])
+            delete_endpoints(cursor, f"{args.table}_lines", nearest[0][0])
+            deleted.append(nearest[0][0])
+            nearest = shortest_connect(f"{args.table}_lines", cursor, line[0], line[1])
 
     # Closed non-labelled
     cursor.execute(f"""
@@ -205,7 +349,7 @@ def main():
 
     print("Unlabeled rings")
     cursor.execute(f"""
-        SELECT topring.id, topring.wkb_geometry FROM {args.table}_lines AS topring
+        SELECT topring.id FROM {args.table}_lines AS topring
         WHERE ST_IsClosed(topring.wkb_geometry) AND
           (topring.type LIKE '%CONTOURS%' OR topring.type LIKE '%00%') AND
           EXISTS (
@@ -219,8 +363,12 @@ def main():
               CASE WHEN ST_IsClosed(topring.wkb_geometry) THEN
                 ST_Covers(ST_MakePolygon(topring.wkb_geometry), covers.wkb_geometry) END)""")
     lines = cursor.fetchall()
-    for line in lines:
-        label_rings(args.verbose, f"{args.table}_lines", cursor, line)
+    ring_tree(cursor, f"{args.table}_lines",
+              "type LIKE '%CONTOURS%' OR type LIKE '%00%' OR type LIKE '%COASTLINE%'")
+    label_rings(args.verbose, f"{args.table}_lines", cursor, [line[0] for line in lines])
+
+    print("Unlabeled lines")
+    propagate_elevations(args.verbose, f"{args.table}_lines", cursor)
 
     # Convert to polygons
     print("Turn closed lines into polygons")
@@ -5,7 +5,7 @@ done.
 """
 import sys
 import argparse
-import psycopg2
+from harn_db import connect
 
 EPS = 0.01
 
@@ -25,12 +25,7 @@ def main():
         help='verbose', required=False)
     args = parser.parse_args()
 
-    conn = psycopg2.connect(
-        user=f"{args.db.split('@')[0].split(':')[0]}",
-        password=f"{args.db.split('@')[0].split(':')[1]}",
-        database=f"{args.db.split('@')[1].split(':')[0]}",
-        host=f"{args.db.split('@')[1].split(':')[1]}",
-        port=f"{args.db.split('@')[1].split(':')[2]}")
+    conn = connect(args.db)
     cursor = conn.cursor()
 
     # Initialize
@@ -50,7 +45,7 @@ def main():
     print("Elevate all lakes")
     cursor.execute(f"""
         UPDATE {args.table}_lines SET type = 'Lake'
-        WHERE ST_IsClosed(wkb_geometry) AND type LIKE '%LAKES%' AND style LIKE '%fill: #d4effc%'""")
+        WHERE ST_IsClosed(wkb_geometry) AND type LIKE '%LAKES%' AND fill = '#d4effc'""")
 
     conn.commit()
 
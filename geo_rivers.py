@@ -4,68 +4,91 @@ Detect all rivers.
 """
 import sys
 import argparse
-import psycopg2
+from harn_db import connect, prepare, execute, temp_table
 
 EPS = 0.0045 # must be a bit bigger than EPSB from geo_coast
 
-def make_axis(verbose, table, cursor, merge, bound):
-    """Removes the smallest segments until a single line remains. Update."""
-    sql_array = "'" + "'::geometry, '".join(merge) + "'::geometry"
-    cursor.execute(f"""
-        WITH lines (geo) AS (
-          SELECT (ST_Dump(ST_Union(ARRAY[{sql_array}]))).geom)
-        SELECT (ST_Dump(ST_LineMerge(ST_Union(geo)))).geom FROM lines
-        WHERE ST_Covers(ST_Buffer('{bound[1]}'::geometry, -{EPS/50}), geo)""")
-    merge = cursor.fetchall()
+def make_axis(verbose, table, cursor, row_id):
+    """Add the medial axis of an area river as candidate lines."""
+    prepare(cursor, 'make_axis', f"""
+        WITH bound (geo) AS (
+            SELECT ST_Buffer(ST_MakePolygon(wkb_geometry), {EPS}/100)
+            FROM {table} WHERE id = $1),
+          lines (geo) AS (
+            SELECT (ST_Dump(ST_Union(ARRAY[CG_ApproximateMedialAxis(bound.geo)]))).geom
+            FROM bound)
+        INSERT INTO {table} (id, name, type, wkb_geometry)
+        SELECT nextval('serial'), 'candidate', 'STREAMS', ST_Union(ARRAY[medials.geo]) FROM (
+          SELECT (ST_Dump(ST_LineMerge(ST_Union(lines.geo)))).geom FROM lines, bound
+          WHERE ST_Covers(ST_Buffer(bound.geo, -{EPS/50}), lines.geo))
+        AS medials (geo)
+        RETURNING id""", ['integer'])
+    merge = execute(cursor, 'make_axis', row_id)
     if verbose:
-        print(f"- Create axis for {bound[0]} with {len(merge)} medial(s)")
-    for m in merge:
-        sql_array = "'" + "'::geometry, '".join(m) + "'::geometry"
-        cursor.execute(f"""
-            INSERT INTO {table} (id, name, type, wkb_geometry)
-            VALUES (nextval('serial'), 'candidate', 'STREAMS', ST_Union(ARRAY[{sql_array}]))""")
+        print(f"- Create axis for {row_id} with {len(merge)} medial(s)")
 
 def handle_lakes(args, cursor, vertex, level, lakes):
     """Add lakes to river network."""
     other_vertex = 'end' if vertex == 'start' else 'start'
     print(f"Handle lakes level {level} for {vertex}")
+    prepare(cursor, f"lake_mouths_{vertex}", f"""
+        SELECT tl.id FROM {args.table}_lines AS tl, river_lakes AS lake
+        WHERE lake.id = $1 AND tl.type LIKE $2 AND
+          ST_Distance(ST_MakePolygon(lake.wkb_geometry),
+            ST_{vertex.capitalize()}Point(tl.wkb_geometry)) < {EPS} AND
+          ST_Distance(ST_MakePolygon(lake.wkb_geometry),
+            ST_{vertex.capitalize()}Point(tl.wkb_geometry)) > 0""", ['integer', 'text'])
+    prepare(cursor, 'cut_by_lake', f"""
+        UPDATE {args.table}_lines AS tl SET wkb_geometry = COALESCE((
+          SELECT pieces.geo FROM (
+            SELECT (ST_Dump(
+              ST_Difference(ST_MakeValid(tl.wkb_geometry),
+                ST_MakeValid(ST_MakePolygon(lake.wkb_geometry))))).geom
+            FROM river_lakes AS lake
+            WHERE lake.id = $2)
+          AS pieces (geo) ORDER BY ST_Length(pieces.geo) DESC
+          LIMIT 1), tl.wkb_geometry)
+        WHERE tl.id = $1""", ['integer', 'integer'])
     for lake in lakes:
-        cursor.execute(f"""
-            SELECT id FROM {args.table}_lines
-            WHERE type LIKE 'River/{level}/Mouth:{other_vertex}' AND
-              ST_Distance(ST_MakePolygon('{lake[1]}'::geometry),
-                ST_{vertex.capitalize()}Point(wkb_geometry)) < {EPS} AND
-              ST_Distance(ST_MakePolygon('{lake[1]}'::geometry),
-                ST_{vertex.capitalize()}Point(wkb_geometry)) > 0""")
-        lines = cursor.fetchall() # lines with v in lake and ov connected
+        # lines with v in lake and ov connected
+        lines = execute(cursor, f"lake_mouths_{vertex}", lake[0],
+                        f"River/{level}/Mouth:{other_vertex}")
         for pts in lines:
             if args.verbose:
                 print(f"- line {pts} in lake {lake[0]}")
-            cursor.execute(f"""
-                WITH lines(geo) AS (
-                  SELECT (ST_Dump(
-                    ST_Difference(ST_MakeValid(wkb_geometry),
-                      ST_MakeValid(ST_MakePolygon('{lake[1]}'::geometry))))).geom
-                  FROM {args.table}_lines
-                  WHERE id = {pts[0]})
-                SELECT lines.geo FROM lines ORDER BY ST_Length(lines.geo) DESC
-                LIMIT 1""")
-            line = cursor.fetchall()[0]
-            cursor.execute(f"""
-                UPDATE {args.table}_lines SET wkb_geometry = '{line[0]}'::geometry
-                WHERE id = {pts[0]}""")
+            execute(cursor, 'cut_by_lake', pts[0], lake[0])
         if len(lines) > 0:
-            handle_river(args, cursor, vertex, level + 1, lake[1])
-            handle_river(args, cursor, other_vertex, level + 1, lake[1])
+            temp_table(cursor, 'river_old', """
+                SELECT wkb_geometry AS geo FROM river_lakes WHERE id = %s""", (lake[0],))
+            handle_river(args, cursor, vertex, level + 1)
+            handle_river(args, cursor, other_vertex, level + 1)
 
-def handle_river(args, cursor, vertex, level, old):
-    """Creates rivers for all lines. Update."""
+def handle_river(args, cursor, vertex, level):
+    """Creates rivers for all lines ending at the geometry in river_old. Update."""
     idx = 0 if vertex == 'start' else -1
     print(f"Handle outflows level {level} for {vertex}")
+    prepare(cursor, 'river_touches', f"""
+        SELECT ST_NPoints(wkb_geometry), ST_Intersects(old.geo, wkb_geometry)
+        FROM {args.table}_lines, river_old AS old
+        WHERE id = $1""", ['integer'])
+    prepare(cursor, f"river_shorten_{vertex}", f"""
+        UPDATE {args.table}_lines SET wkb_geometry =
+          ST_RemovePoint(wkb_geometry, {idx} * (1 - ST_NPoints(wkb_geometry)))
+        WHERE id = $1""", ['integer'])
+    prepare(cursor, f"river_mouth_{vertex}", f"""
+        INSERT INTO {args.table}_lines (id, name, type, wkb_geometry)
+        SELECT nextval('serial'), '-', $2,
+          ST_SetPoint(ST_RemoveRepeatedPoints(wkb_geometry), {idx},
+            ST_ClosestPoint(old.geo, ST_{vertex.capitalize()}Point(wkb_geometry)))
+        FROM {args.table}_lines, river_old AS old
+        WHERE id = $1
+        RETURNING id""", ['integer', 'text'])
+    prepare(cursor, 'delete_river', f"""
+        DELETE FROM {args.table}_lines WHERE id = $1""", ['integer'])
     cursor.execute(f"""
-        SELECT id, name, type FROM {args.table}_lines
+        SELECT id, name, type FROM {args.table}_lines, river_old AS old
         WHERE name = 'candidate' AND type NOT LIKE 'River/%' AND
-          ST_Distance('{old}'::geometry,
+          ST_Distance(old.geo,
             ST_{vertex.capitalize()}Point(wkb_geometry)) < {EPS}""")
     lines = cursor.fetchall()
     print(f"Shift {len(lines)} river {vertex}s")
@@ -73,44 +96,19 @@ def handle_river(args, cursor, vertex, level, old):
         if args.verbose:
             print(f"- line {pts} with {vertex}")
         while True:
-            cursor.execute(f"""
-                SELECT ST_Distance('{old}'::geometry,
-                  ST_{vertex.capitalize()}Point(wkb_geometry)),
-                  ST_NPoints(wkb_geometry)
-                FROM {args.table}_lines
-                WHERE id = {pts[0]}""")
-            line = cursor.fetchall()
+            line = execute(cursor, 'river_touches', pts[0])
             if args.verbose:
-                print(f"- - shorten {pts[0]}: {line[0][1]}")
-            cursor.execute(f"""
-                SELECT ST_Intersects('{old}'::geometry, wkb_geometry), ST_AsText(wkb_geometry)
-                FROM {args.table}_lines WHERE id = {pts[0]}""")
-            intersects = cursor.fetchall()[0]
-            if not intersects[0]:
+                print(f"- - shorten {pts[0]}: {line[0][0]}")
+            if not line[0][1]:
                 break
-            if line[0][1] < 3:
+            if line[0][0] < 3:
                 print(f"ERROR: duplicate at {pts[0]}")
-                cursor.execute(f"""
-                    DELETE FROM {args.table}_lines WHERE id = {pts[0]}""")
+                execute(cursor, 'delete_river', pts[0])
                 break
-            cursor.execute(f"""
-                UPDATE {args.table}_lines SET wkb_geometry =
-                  ST_RemovePoint(wkb_geometry, {idx} * (1 - ST_NPoints(wkb_geometry)))
-                WHERE id = {pts[0]}""")
-        cursor.execute(f"""
-            SELECT wkb_geometry,
-              ST_ClosestPoint('{old}'::geometry, ST_{vertex.capitalize()}Point(wkb_geometry))
-            FROM {args.table}_lines
-            WHERE id = {pts[0]}""")
-        pts2 = cursor.fetchall()
-        if len(pts2) > 0:
-            cursor.execute(f"""
-                INSERT INTO {args.table}_lines (id, name, type, wkb_geometry)
-                VALUES (nextval('serial'), '-', 'River/{level}/Mouth:{vertex}',
-                  ST_SetPoint(ST_RemoveRepeatedPoints('{pts2[0][0]}'::geometry), {idx},
-                    '{pts2[0][1]}'::geometry))""")
-            cursor.execute(f"""
-                DELETE FROM {args.table}_lines WHERE id = {pts[0]}""")
+            execute(cursor, f"river_shorten_{vertex}", pts[0])
+        if len(execute(cursor, f"river_mouth_{vertex}", pts[0],
+                       f"River/{level}/Mouth:{vertex}")) > 0:
+            execute(cursor, 'delete_river', pts[0])
     return len(lines)
 
 def main():
@@ -132,12 +130,7 @@ def main():
         required=False)
     args = parser.parse_args()
 
-    conn = psycopg2.connect(
-        user=f"{args.db.split('@')[0].split(':')[0]}",
-        password=f"{args.db.split('@')[0].split(':')[1]}",
-        database=f"{args.db.split('@')[1].split(':')[0]}",
-        host=f"{args.db.split('@')[1].split(':')[1]}",
-        port=f"{args.db.split('@')[1].split(':')[2]}")
+    conn = connect(args.db)
     cursor = conn.cursor()
 
     # Initialize
@@ -333,37 +326,34 @@ def main():
     cursor.execute(f"""
         SELECT count(*) FROM {args.table}_lines
         WHERE type LIKE '%STREAMS%' AND (NOT ST_IsClosed(wkb_geometry) OR
-          ST_IsClosed(wkb_geometry) AND style LIKE '%fill: #36868d%')""")
+          ST_IsClosed(wkb_geometry) AND fill = '#36868d')""")
     print(f"Found {cursor.fetchall()[0][0]} rivers")
 
     # These are all extended rivers
     # (Buffer because there are strange duplicates)
     cursor.execute(f"""
-        SELECT id, ST_Buffer(ST_MakePolygon(wkb_geometry), {EPS}/100)
+        SELECT id
         FROM {args.table}_lines
         WHERE type LIKE '%STREAMS%' AND ST_IsClosed(wkb_geometry) AND
-          style LIKE '%fill: #36868d%'""")
+          fill = '#36868d'""")
     rows = cursor.fetchall()
     print(f"Thinning area rivers: {len(rows)}")
     for row in rows:
-        cursor.execute(f"""
-            SELECT CG_ApproximateMedialAxis('{row[1]}'::geometry)""")
-        axis = cursor.fetchall()
-        make_axis(args.verbose, f"{args.table}_lines", cursor, [l[0] for l in axis], row)
+        make_axis(args.verbose, f"{args.table}_lines", cursor, row[0])
     cursor.execute(f"""
         UPDATE {args.table}_lines SET name = 'candidate'
         WHERE type LIKE '%STREAMS%' AND NOT ST_IsClosed(wkb_geometry)""")
 
     # Shores
-    cursor.execute(f"""
-        SELECT ST_Union(wkb_geometry) FROM {args.table}_lines WHERE type = '0'""")
-    old_term = cursor.fetchall()[0][0]
-    cursor.execute(f"""
+    temp_table(cursor, 'river_old', f"""
+        SELECT ST_Union(wkb_geometry) AS geo FROM {args.table}_lines WHERE type = '0'""")
+    temp_table(cursor, 'river_lakes', f"""
         SELECT id, wkb_geometry FROM {args.table}_lines
         WHERE type = 'COASTLINE/tmp-lake' OR type LIKE 'Lake/%'""")
+    cursor.execute("SELECT id FROM river_lakes")
     lakes = cursor.fetchall()
-    length = handle_river(args, cursor, "start", 0, old_term)
-    length += handle_river(args, cursor, "end", 0, old_term)
+    length = handle_river(args, cursor, "start", 0)
+    length += handle_river(args, cursor, "end", 0)
     handle_lakes(args, cursor, "start", 0, lakes)
     handle_lakes(args, cursor, "end", 0, lakes)
 
@@ -371,12 +361,11 @@ def main():
     level = 0
     while length > 0:
         level = level + 1
-        cursor.execute(f"""
-            SELECT ST_Union(wkb_geometry) FROM {args.table}_lines
+        temp_table(cursor, 'river_old', f"""
+            SELECT ST_Union(wkb_geometry) AS geo FROM {args.table}_lines
             WHERE type LIKE 'River/{level-1}/%'""")
-        old_term = cursor.fetchall()[0][0]
-        length = handle_river(args, cursor, "start", level, old_term)
-        length += handle_river(args, cursor, "end", level, old_term)
+        length = handle_river(args, cursor, "start", level)
+        length += handle_river(args, cursor, "end", level)
         handle_lakes(args, cursor, "start", level, lakes)
         handle_lakes(args, cursor, "end", level, lakes)
 
@@ -5,7 +5,7 @@ if within reasonable distance.
 """
 import sys
 import argparse
-import psycopg2
+from harn_db import connect, prepare, execute, temp_table
 
 EPSG = 0.005 # gap to bridge
 
@@ -25,12 +25,7 @@ def main():
         help='verbose', required=False)
     args = parser.parse_args()
 
-    conn = psycopg2.connect(
-        user=f"{args.db.split('@')[0].split(':')[0]}",
-        password=f"{args.db.split('@')[0].split(':')[1]}",
-        database=f"{args.db.split('@')[1].split(':')[0]}",
-        host=f"{args.db.split('@')[1].split(':')[1]}",
-        port=f"{args.db.split('@')[1].split(':')[2]}")
+    conn = connect(args.db)
     cursor = conn.cursor()
 
     # Initialize
@@ -67,10 +62,24 @@ def main():
           type LIKE '%Castle%'"
 
     # Get all locations
-    cursor.execute(f"""
-        SELECT ST_Union(wkb_geometry) FROM {args.table}_pts
-        WHERE {sql_locs}""")
-    pts = cursor.fetchall()[0][0]
+    temp_table(cursor, 'road_locs', f"""
+        SELECT ST_Union(wkb_geometry) AS geo FROM {args.table}_pts
+        WHERE ({sql_locs}) AND type NOT LIKE '%/text'""")
+    prepare(cursor, 'snap_road', f"""
+        UPDATE {args.table}_lines
+        SET wkb_geometry = ST_Snap(wkb_geometry, $2, {EPSG*1.01})
+        WHERE id = $1""", ['integer', 'geometry'])
+    prepare(cursor, 'set_road_point', f"""
+        UPDATE {args.table}_lines
+        SET wkb_geometry = ST_SetPoint(wkb_geometry, $2, $3)
+        WHERE id = $1""", ['integer', 'integer', 'geometry'])
+    prepare(cursor, 'remove_road_point', f"""
+        UPDATE {args.table}_lines
+        SET wkb_geometry = ST_RemovePoint(wkb_geometry, $2)
+        WHERE id = $1""", ['integer', 'integer'])
+    prepare(cursor, 'delete_road', f"""
+        DELETE FROM {args.table}_lines
+        WHERE id = $1""", ['integer'])
 
     # Shift all roads onto locations
     cursor.execute(f"""
@@ -81,7 +90,7 @@ def main():
             ST_Distance(wkb_geometry, tl.wkb_geometry) < {EPSG} AND
             ST_Distance(wkb_geometry, tl.wkb_geometry) <> 0)
         AS tr (id, geo) ON TRUE
-        WHERE {sql_locs}
+        WHERE ({sql_locs}) AND type NOT LIKE '%/text'
         GROUP BY tl.id""")
     pt_lines = cursor.fetchall()
     print(f"Shift {len(pt_lines)} roads onto locations")
@@ -89,10 +98,7 @@ def main():
         if args.verbose:
             print(f"- shift onto {pt_line[0]}")
         for pt_i in pt_line[1]:
-            cursor.execute(f"""
-                UPDATE {args.table}_lines
-                SET wkb_geometry = ST_Snap(wkb_geometry, '{pt_line[2]}'::geometry, {EPSG*1.01})
-                WHERE id = {pt_i}""")
+            execute(cursor, 'snap_road', pt_i, pt_line[2])
 
     # Shift all road starts/ends
     cursor.execute(f"""
@@ -101,7 +107,7 @@ def main():
           SELECT ts.id, ts.wkb_geometry FROM {args.table}_lines AS ts
           WHERE ts.id <> tl.id AND ts.type LIKE '%ROADS%' AND
             ST_Distance(ST_StartPoint(ts.wkb_geometry), tl.wkb_geometry) < {EPSG} AND
-            ST_Distance(ST_StartPoint(ts.wkb_geometry), '{pts}'::geometry) > {EPSG/2})
+            ST_Distance(ST_StartPoint(ts.wkb_geometry), (SELECT geo FROM road_locs)) > {EPSG/2})
         AS tr (id, geo) ON TRUE
         WHERE tl.type LIKE '%ROADS%'""")
     pt_lines = cursor.fetchall()
@@ -110,22 +116,16 @@ def main():
         if args.verbose:
             print(f"- start {pt_line[1]} on {pt_line[0]}")
         # Make adjacent line include new start point
-        cursor.execute(f"""
-            UPDATE {args.table}_lines
-            SET wkb_geometry = ST_Snap(wkb_geometry, '{pt_line[2]}'::geometry, {EPSG*1.01})
-            WHERE id = {pt_line[0]}""")
+        execute(cursor, 'snap_road', pt_line[0], pt_line[2])
         # Make ending line end in new start point
-        cursor.execute(f"""
-            UPDATE {args.table}_lines
-            SET wkb_geometry = ST_SetPoint(wkb_geometry, 0, '{pt_line[2]}'::geometry)
-            WHERE id = {pt_line[1]}""")
+        execute(cursor, 'set_road_point', pt_line[1], 0, pt_line[2])
     cursor.execute(f"""
         SELECT tl.id, tr.id, ST_ClosestPoint(tl.wkb_geometry, ST_EndPoint(tr.geo))
         FROM {args.table}_lines AS tl INNER JOIN LATERAL (
           SELECT ts.id, ts.wkb_geometry FROM {args.table}_lines AS ts
           WHERE ts.id <> tl.id AND ts.type LIKE '%ROADS%' AND
             ST_Distance(ST_EndPoint(ts.wkb_geometry), tl.wkb_geometry) < {EPSG} AND
-            ST_Distance(ST_EndPoint(ts.wkb_geometry), '{pts}'::geometry) > {EPSG/2})
+            ST_Distance(ST_EndPoint(ts.wkb_geometry), (SELECT geo FROM road_locs)) > {EPSG/2})
         AS tr (id, geo) ON TRUE
         WHERE tl.type LIKE '%ROADS%'""")
     pt_lines = cursor.fetchall()
@@ -134,70 +134,54 @@ def main():
         if args.verbose:
             print(f"- end {pt_line[1]} on {pt_line[0]}")
         # Make adjacent line include new end point
-        cursor.execute(f"""
-            UPDATE {args.table}_lines
-            SET wkb_geometry = ST_Snap(wkb_geometry, '{pt_line[2]}'::geometry, {EPSG*1.01})
-            WHERE id = {pt_line[0]}""")
+        execute(cursor, 'snap_road', pt_line[0], pt_line[2])
         # Make ending line end in new end point
-        cursor.execute(f"""
-            UPDATE {args.table}_lines
-            SET wkb_geometry = ST_SetPoint(wkb_geometry, -1, '{pt_line[2]}'::geometry)
-            WHERE id = {pt_line[1]}""")
+        execute(cursor, 'set_road_point', pt_line[1], -1, pt_line[2])
 
     print(f"Remove some artifacts")
     cursor.execute(f"""
-        SELECT id, ST_NPoints(wkb_geometry) FROM {args.table}_lines
+        SELECT id, ST_NPoints(wkb_geometry) FROM {args.table}_lines, road_locs AS locs
         WHERE type LIKE '%ROADS%' AND
-          ST_Distance(ST_StartPoint(wkb_geometry), '{pts}'::geometry) < {EPSG} AND
-          ST_Distance(ST_StartPoint(wkb_geometry), '{pts}'::geometry) <> 0""")
+          ST_Distance(ST_StartPoint(wkb_geometry), locs.geo) < {EPSG} AND
+          ST_Distance(ST_StartPoint(wkb_geometry), locs.geo) <> 0""")
     pt_lines = cursor.fetchall()
     for pt_line in pt_lines:
         if (pt_line[1] > 2):
-            cursor.execute(f"""
-                UPDATE {args.table}_lines
-                SET wkb_geometry = ST_RemovePoint(wkb_geometry, 0)
-                WHERE id = {pt_line[0]}""")
+            execute(cursor, 'remove_road_point', pt_line[0], 0)
         else:
-            cursor.execute(f"""
-                DELETE FROM {args.table}_lines
-                WHERE id = {pt_line[0]}""")
+            execute(cursor, 'delete_road', pt_line[0])
     cursor.execute(f"""
-        SELECT id, ST_NPoints(wkb_geometry) FROM {args.table}_lines
+        SELECT id, ST_NPoints(wkb_geometry) FROM {args.table}_lines, road_locs AS locs
         WHERE type LIKE '%ROADS%' AND
-          ST_Distance(ST_EndPoint(wkb_geometry), '{pts}'::geometry) < {EPSG} AND
-          ST_Distance(ST_EndPoint(wkb_geometry), '{pts}'::geometry) <> 0""")
+          ST_Distance(ST_EndPoint(wkb_geometry), locs.geo) < {EPSG} AND
+          ST_Distance(ST_EndPoint(wkb_geometry), locs.geo) <> 0""")
     pt_lines = cursor.fetchall()
     for pt_line in pt_lines:
         if (pt_line[1] > 2):
-            cursor.execute(f"""
-                UPDATE {args.table}_lines
-                SET wkb_geometry = ST_RemovePoint(wkb_geometry, {pt_line[1] - 1})
-                WHERE id = {pt_line[0]}""")
+            execute(cursor, 'remove_road_point', pt_line[0], pt_line[1] - 1)
         else:
-            cursor.execute(f"""
-                DELETE FROM {args.table}_lines
-                WHERE id = {pt_line[0]}""")
+            execute(cursor, 'delete_road', pt_line[0])
 
     print(f"Make all trails")
     cursor.execute(f"""
         INSERT INTO {args.table}_lines (id, name, type, wkb_geometry)
         SELECT nextval('serial'), '-', 'Trail', tl.geo FROM (
           SELECT (ST_Dump(ST_LineMerge(ST_Union(wkb_geometry)))).geom FROM {args.table}_lines
-          WHERE type LIKE '%ROADS%' AND style LIKE '%dasharray: 1 1%')
+          WHERE type LIKE '%ROADS%' AND dasharray = '1 1')
         AS tl (geo)""")
     print(f"Make all unpaved roads")
     cursor.execute(f"""
         INSERT INTO {args.table}_lines (id, name, type, wkb_geometry)
         SELECT nextval('serial'), '-', 'Unpaved', tl.geo FROM (
           SELECT (ST_Dump(ST_LineMerge(ST_Union(wkb_geometry)))).geom FROM {args.table}_lines
-          WHERE type LIKE '%ROADS%' AND style LIKE '%dasharray: 2 1%')
+          WHERE type LIKE '%ROADS%' AND dasharray = '2 1')
         AS tl (geo)""")
     print(f"Make all paved roads")
     cursor.execute(f"""
         INSERT INTO {args.table}_lines (id, name, type, wkb_geometry)
         SELECT nextval('serial'), '-', 'Paved', tl.geo FROM (
           SELECT (ST_Dump(ST_LineMerge(ST_Union(wkb_geometry)))).geom FROM {args.table}_lines
-          WHERE type LIKE '%ROADS%' AND style NOT LIKE '%dasharray:%')
+          WHERE type LIKE '%ROADS%' AND dasharray IS NULL)
         AS tl (geo)""")
 
     conn.commit()
@@ -4,71 +4,65 @@ Creates all vegetation (including shoal/reef).
 """
 import sys
 import argparse
-import psycopg2
+from harn_db import connect, prepare, execute, temp_table
 
 EPSG = 0.00025 # grow to cover draw glitches
 EPSI = 0.01 # grow swamp
 EPSD = 0.0125 # shrink swamp
 
-def geo_array(rows):
-    """Create a postgis geometry array."""
-    return "'" + "'::geometry, '".join([row[0] for row in rows]) + "'::geometry"
-
 def make_swamp(args, cursor):
-    """Make Swamp out of various pieces."""
+    """Make Swamp out of various pieces, added to veg_raw."""
 
     # Areas as lines
     cursor.execute(f"""
-        SELECT topring.id, ST_MakeValid(ST_MakePolygon(topring.wkb_geometry))
-        FROM {args.table}_lines AS topring
-        WHERE ST_IsClosed(topring.wkb_geometry) AND
-          topring.type LIKE '%SWAMP%' AND
-          NOT EXISTS (
-            SELECT * FROM {args.table}_lines AS covers
-            WHERE covers.type LIKE '%SWAMP%' AND
-              topring.id <> covers.id AND
-              CASE WHEN ST_IsClosed(covers.wkb_geometry) THEN
-                ST_Covers(ST_MakePolygon(covers.wkb_geometry), topring.wkb_geometry) END)""")
-    ret = []
-    for poly in cursor.fetchall():
-        cursor.execute(f"""
+        WITH swamps (id, holed, geo) AS (
+          SELECT top.id, holes.geo IS NOT NULL, COALESCE(ST_Difference(top.geo, holes.geo), top.geo)
+          FROM (
+            SELECT topring.id, ST_MakeValid(ST_MakePolygon(topring.wkb_geometry))
+            FROM {args.table}_lines AS topring
+            WHERE ST_IsClosed(topring.wkb_geometry) AND
+              topring.type LIKE '%SWAMP%' AND
+              NOT EXISTS (
+                SELECT * FROM {args.table}_lines AS covers
+                WHERE covers.type LIKE '%SWAMP%' AND
+                  topring.id <> covers.id AND
+                  CASE WHEN ST_IsClosed(covers.wkb_geometry) THEN
+                    ST_Covers(ST_MakePolygon(covers.wkb_geometry), topring.wkb_geometry) END))
+          AS top (id, geo) CROSS JOIN LATERAL (
             SELECT ST_Union(ST_MakeValid(ST_MakePolygon(wkb_geometry)))
             FROM {args.table}_lines
             WHERE type LIKE '%SWAMP%' AND ST_NPoints(wkb_geometry) > 3 AND
-              {poly[0]} <> id AND
+              top.id <> id AND
               CASE WHEN ST_IsClosed(wkb_geometry) THEN
-                ST_Covers('{poly[1]}'::geometry, ST_MakePolygon(wkb_geometry))
-              END""")
-        holes = cursor.fetchall()[0]
+                ST_Covers(top.geo, ST_MakePolygon(wkb_geometry))
+              END)
+          AS holes (geo)),
+        ins AS (
+          INSERT INTO veg_raw (typ, geo) SELECT 'SWAMP', geo FROM swamps)
+        SELECT id, holed FROM swamps""")
+    for poly in cursor.fetchall():
         if args.verbose:
             print(f"- swamp poly {poly[0]}")
-        if holes[0] is not None:
-            if args.verbose:
+            if poly[1]:
                 print(f"- - with holes")
-            cursor.execute(f"""
-                SELECT ST_Difference('{poly[1]}'::geometry, '{holes[0]}'::geometry)""")
-            ret.append([cursor.fetchall()[0][0]])
-        else:
-            ret.append([poly[1]])
 
     # Symbols on polys
     cursor.execute(f"""
-        SELECT ST_Buffer(
+        INSERT INTO veg_raw (typ, geo)
+        SELECT 'SWAMP', ST_Buffer(
             ST_Buffer(
               ST_Buffer(ST_Union(ST_MakeValid(wkb_geometry)), {EPSI}), -{EPSD}), {EPSD})
         FROM {args.table}_polys
         WHERE type LIKE '%SWAMP%'""")
-    ret.append([cursor.fetchall()[0][0]])
 
     # Symbols on lines
     cursor.execute(f"""
-        SELECT ST_Buffer(
+        INSERT INTO veg_raw (typ, geo)
+        SELECT 'SWAMP', ST_Buffer(
             ST_Buffer(
               ST_Buffer(ST_Union(wkb_geometry), {EPSI}), -{EPSD}), {EPSD})
         FROM {args.table}_lines
         WHERE NOT ST_IsClosed(wkb_geometry) AND type LIKE '%SWAMP%'""")
-    ret.append([cursor.fetchall()[0][0]])
-    return ret
 
 def main():
     """Main method."""
@@ -86,12 +80,7 @@ def main():
         help='verbose', required=False)
     args = parser.parse_args()
 
-    conn = psycopg2.connect(
-        user=f"{args.db.split('@')[0].split(':')[0]}",
-        password=f"{args.db.split('@')[0].split(':')[1]}",
-        database=f"{args.db.split('@')[1].split(':')[0]}",
-        host=f"{args.db.split('@')[1].split(':')[1]}",
-        port=f"{args.db.split('@')[1].split(':')[2]}")
+    conn = connect(args.db)
     cursor = conn.cursor()
 
     # Initialize
@@ -112,49 +101,46 @@ def main():
         ALTER TABLE {args.table}_polys ALTER id SET NOT NULL;
         SELECT count(*) FROM {args.table}_lines WHERE {sql_area}""")
     print(f"Identifying areas: {cursor.fetchall()[0][0]}")
-    redux = {}
-    raw = {}
     for typ in types:
         print(f"Set up {typ}")
         if typ == "WOODLAND":
-            cursor.execute(f"""
-                SELECT ST_MakePolygon(wkb_geometry)
+            temp_table(cursor, 'veg_raw', f"""
+                SELECT '{typ}'::text AS typ, ST_MakePolygon(wkb_geometry) AS geo
                 FROM {args.table}_lines
                 WHERE type = '0' AND ST_NPoints(wkb_geometry) > 3""")
-            rows = list(cursor.fetchall())
-            land = geo_array(rows)
-            cursor.execute(f"""SELECT ST_Union(ARRAY[{land}])""")
-            land_sql = cursor.fetchall()[0][0]
+            temp_table(cursor, 'veg_land', """
+                SELECT ST_Union(geo) AS geo FROM veg_raw""")
         elif typ == "SWAMP":
-            rows = make_swamp(args, cursor)
+            make_swamp(args, cursor)
         else:
             cursor.execute(f"""
-                SELECT ST_Buffer(
+                INSERT INTO veg_raw (typ, geo)
+                SELECT '{typ}', ST_Buffer(
                   ST_MakePolygon(ST_AddPoint(wkb_geometry, ST_StartPoint(wkb_geometry))), {EPSG}, 2)
                 FROM {args.table}_lines
                 WHERE type LIKE '%{typ}%' AND ST_NPoints(wkb_geometry) > 3""")
-            rows = list(cursor.fetchall())
-        raw[typ] = geo_array(rows)
-        print(f"Found {len(rows)}")
+        cursor.execute("SELECT count(*) FROM veg_raw WHERE typ = %s", (typ,))
+        print(f"Found {cursor.fetchall()[0][0]}")
 
+    temp_table(cursor, 'veg_redux', """
+        SELECT typ, ST_Union(geo) AS geo FROM veg_raw GROUP BY typ""")
+    prepare(cursor, 'reduce_vegetation', """
+        UPDATE veg_redux
+        SET geo = ST_Difference(veg_redux.geo, raw.geo)
+        FROM (SELECT ST_Union(geo) FROM veg_raw WHERE typ = $2) AS raw (geo)
+        WHERE veg_redux.typ = $1 AND raw.geo IS NOT NULL""", ['text', 'text'])
     for i, ty_i in enumerate(types):
         print(f"Normalize {ty_i}")
-        redux[ty_i] = raw[ty_i]
         for j in range(i + 1, len(types) - 1):
             if args.verbose:
                 print(f"- reduce {ty_i} by {types[j]}")
-            cursor.execute(f"""
-                SELECT ST_Union(ARRAY[{raw[types[j]]}])""")
-            cursor.execute(f"""
-                SELECT ST_Difference(
-                  ST_Union(ARRAY[{redux[ty_i]}]), ST_Union(ARRAY[{raw[types[j]]}]))""")
-            redux[ty_i] = geo_array(list(cursor.fetchall()))
+            execute(cursor, 'reduce_vegetation', ty_i, types[j])
 
         cursor.execute(f"""
             WITH ret AS (
               INSERT INTO {args.table}_polys (id, name, type, wkb_geometry)
               SELECT nextval('serial'), '-', 'VEGTMP/{ty_i}', tl.geo FROM (
-                SELECT (ST_Dump(ST_Union(ARRAY[{redux[ty_i]}]))).geom)
+                SELECT (ST_Dump(geo)).geom FROM veg_redux WHERE typ = '{ty_i}')
               AS tl (geo)
               WHERE ST_GeometryType(tl.geo) = 'ST_Polygon' RETURNING id)
             SELECT * FROM ret""")
@@ -165,16 +151,16 @@ def main():
     cursor.execute(f"""
         INSERT INTO {args.table}_polys (id, name, type, wkb_geometry)
         SELECT nextval('serial'), '-', 'VEG/' || tl.typ, tl.geo FROM (
-          SELECT (ST_Dump(ST_Intersection(wkb_geometry, '{land_sql}'::geometry))).geom, substring(type, 8)
-          FROM {args.table}_polys
+          SELECT (ST_Dump(ST_Intersection(wkb_geometry, land.geo))).geom, substring(type, 8)
+          FROM {args.table}_polys, veg_land AS land
           WHERE type LIKE '%VEGTMP/%' AND type NOT LIKE '%SHOAL%')
         AS tl (geo, typ)""")
     print(f"Restrict shoal/reef to off land")
     cursor.execute(f"""
         INSERT INTO {args.table}_polys (id, name, type, wkb_geometry)
         SELECT nextval('serial'), '-', 'VEG/' || tl.typ, tl.geo FROM (
-          SELECT (ST_Dump(ST_Difference(wkb_geometry, '{land_sql}'::geometry))).geom, substring(type, 8)
-          FROM {args.table}_polys
+          SELECT (ST_Dump(ST_Difference(wkb_geometry, land.geo))).geom, substring(type, 8)
+          FROM {args.table}_polys, veg_land AS land
           WHERE type LIKE '%VEGTMP/%' AND type LIKE '%SHOAL%')
         AS tl (geo, typ)""")
     cursor.execute(f"""
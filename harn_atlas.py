@@ -0,0 +1,41 @@
+#!/usr/bin/python
+"""
+Single entry point for all steps of turning a 'Harn Atlas Map' into
+GIS data.  Every subcommand is one of the scripts, imported only when
+it is run, so a step doesn't pay for the libraries of the others.
+"""
+import sys
+import importlib
+
+COMMANDS = {
+    'extract': ('svg2geo', 'convert the SVG into GIS formats or PostGIS'),
+    'elevation': ('geo_elevation', 'label contours with their elevation'),
+    'coast': ('geo_coast', 'build the coastline and areas of rivers'),
+    'lakes': ('geo_lakes', 'identify lakes'),
+    'roads': ('geo_roads', 'connect roads to locations'),
+    'vegetation': ('geo_vegetation', 'build vegetation polygons'),
+    'rivers': ('geo_rivers', 'connect rivers and streams'),
+}
+
+def usage():
+    """Print the subcommands."""
+    print("usage: harn-atlas COMMAND [options]\n\ncommands:")
+    for command, (_, description) in COMMANDS.items():
+        print(f"  {command:12} {description}")
+    print("\nUse harn-atlas COMMAND -h for the options of a command.")
+
+def main():
+    """Main method."""
+    if len(sys.argv) < 2 or sys.argv[1] in ('-h', '--help'):
+        usage()
+        sys.exit(0 if len(sys.argv) >= 2 else -1)
+    if sys.argv[1] not in COMMANDS:
+        print(f"Unknown command {sys.argv[1]}")
+        usage()
+        sys.exit(-1)
+    module = importlib.import_module(COMMANDS[sys.argv[1]][0])
+    sys.argv = [f"harn-atlas {sys.argv[1]}"] + sys.argv[2:]
+    module.main()
+
+if __name__ == '__main__':
+    main()
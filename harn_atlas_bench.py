@@ -0,0 +1,44 @@
+#!/usr/bin/python
+"""
+Benchmark the startup time of every harn-atlas subcommand, i.e. the
+time until its options are parsed, measured with -h.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import harn_atlas
+
+HARN_ATLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'harn_atlas.py')
+
+def startup(cmd, runs):
+    """Wall times of runs runs of cmd in seconds."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+def main():
+    """Main method."""
+    parser = argparse.ArgumentParser(
+        prog=sys.argv[0],
+        description='Benchmark the startup of harn-atlas subcommands.')
+    parser.add_argument('-r', '--runs', type=int, default=10, help='runs per command',
+                        required=False)
+    args = parser.parse_args()
+
+    print(f"{'command':12} {'min ms':>8} {'median ms':>10}")
+    for command in ['python'] + list(harn_atlas.COMMANDS):
+        if command == 'python':
+            cmd = [sys.executable, '-c', 'pass']
+        else:
+            cmd = [sys.executable, HARN_ATLAS, command, '-h']
+        times = startup(cmd, args.runs)
+        print(f"{command:12} {min(times) * 1000:8.1f} {statistics.median(times) * 1000:10.1f}")
+
+if __name__ == '__main__':
+    main()
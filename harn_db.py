@@ -0,0 +1,172 @@
+"""
+PostGIS access shared by the geo_* scripts: connecting, prepared
+statements, temp tables of line endpoints and rings, and validating
+lines in-process.
+"""
+
+PREPARED = {}
+
+def connect(db):
+    """Connect to PostGIS with a user:password@dbname:host:port string."""
+    import psycopg2
+    login, location = db.split('@', 1)
+    user, password = login.split(':', 1)
+    database, host, port = location.split(':')
+    return psycopg2.connect(user=user, password=password, database=database,
+                            host=host, port=port)
+
+def prepare(cursor, name, sql, types=()):
+    """
+    Prepare sql server side as name, once per connection and sql, so
+    repeated queries are parsed and planned only once.  A name prepared
+    before with another sql, e.g. for another table, is replaced.  Its
+    parameters are $1, $2, ... of the PostgreSQL types given.
+    """
+    prepared = PREPARED.setdefault(cursor.connection, {})
+    if prepared.get(name) != sql:
+        if name in prepared:
+            cursor.execute(f"DEALLOCATE {name}")
+        params = f" ({', '.join(types)})" if types else ''
+        cursor.execute(f"PREPARE {name}{params} AS {sql}")
+        prepared[name] = sql
+
+def execute(cursor, name, *params):
+    """
+    Execute the prepared statement name with params, e.g. ids or
+    geometries as fetched, and return its rows if it has any.  psycopg2
+    quotes params into the EXECUTE statement on the client, so
+    geometries are sent as hex EWKB text and cast to the prepared types
+    by the server.
+    """
+    values = f" ({', '.join(['%s'] * len(params))})" if params else ''
+    cursor.execute(f"EXECUTE {name}{values}", params)
+    return cursor.fetchall() if cursor.description is not None else None
+
+def temp_table(cursor, name, sql, params=None):
+    """
+    (Re)create the temp table name from the query sql, to keep
+    geometries used by many queries on the server instead of sending
+    them along with every query.
+    """
+    cursor.execute(f"""
+        DROP TABLE IF EXISTS {name};
+        CREATE TEMP TABLE {name} AS {sql}""", params)
+
+def make_endpoints(cursor, table, where):
+    """
+    (Re)create the temp table {table}_ends with the start (end_i 1) and
+    end point (end_i 2) of all lines in table matching where, indexed
+    for KNN lookups with <->.
+    """
+    temp_table(cursor, f"{table}_ends", f"""
+        SELECT id, 1 AS end_i, type, ST_StartPoint(wkb_geometry) AS geom
+        FROM {table} WHERE {where}
+        UNION ALL
+        SELECT id, 2 AS end_i, type, ST_EndPoint(wkb_geometry) AS geom
+        FROM {table} WHERE {where}""")
+    cursor.execute(f"""
+        CREATE INDEX ON {table}_ends USING GIST (geom);
+        CREATE INDEX ON {table}_ends (id);
+        ANALYZE {table}_ends""")
+
+def update_endpoints(cursor, table, line_id):
+    """Replace the endpoints of line_id after its geometry changed."""
+    prepare(cursor, f"update_ends_{table}", f"""
+        WITH gone AS (DELETE FROM {table}_ends WHERE id = $1)
+        INSERT INTO {table}_ends (id, end_i, type, geom)
+        SELECT id, 1, type, ST_StartPoint(wkb_geometry) FROM {table} WHERE id = $1
+        UNION ALL
+        SELECT id, 2, type, ST_EndPoint(wkb_geometry) FROM {table} WHERE id = $1""", ['integer'])
+    execute(cursor, f"update_ends_{table}", line_id)
+
+def delete_endpoints(cursor, table, line_id):
+    """Drop the endpoints of the deleted line line_id."""
+    prepare(cursor, f"delete_ends_{table}", f"""
+        DELETE FROM {table}_ends WHERE id = $1""", ['integer'])
+    execute(cursor, f"delete_ends_{table}", line_id)
+
+def ring_tree(cursor, table, where):
+    """
+    Set parent_id of every closed line of table matching where to the
+    id of the smallest of them around it, NULL for the outermost.  The
+    rings stay in the temp table {table}_rings with a GiST index on
+    their polygons.
+    """
+    temp_table(cursor, f"{table}_rings", f"""
+        SELECT id, poly, ST_Area(poly) AS area FROM (
+          SELECT id, ST_MakePolygon(wkb_geometry) FROM {table}
+          WHERE ST_IsClosed(wkb_geometry) AND ST_NPoints(wkb_geometry) > 3 AND ({where}))
+        AS rings (id, poly)""")
+    cursor.execute(f"""
+        CREATE INDEX ON {table}_rings USING GIST (poly);
+        CREATE INDEX ON {table}_rings (id);
+        ANALYZE {table}_rings;
+        ALTER TABLE {table} ADD COLUMN IF NOT EXISTS parent_id integer;
+        UPDATE {table} AS tl SET parent_id = (
+          SELECT parent.id FROM {table}_rings AS parent
+          WHERE ST_Covers(parent.poly, child.poly) AND
+            (parent.area > child.area OR parent.area = child.area AND parent.id < child.id)
+          ORDER BY parent.area ASC, parent.id DESC LIMIT 1)
+        FROM {table}_rings AS child
+        WHERE tl.id = child.id""")
+
+def longest_paths(geoms, keep=None):
+    """
+    Node and merge the lines geoms (hex EWKB as fetched) and drop the
+    shortest piece until a single one is left, or with keep until all
+    are longer than keep.  Pieces meeting at a node left with only the
+    two of them are merged, like ST_LineMerge(ST_Union(...)) again
+    after every drop would do, but in one pass over a heap.  Returns
+    the remaining pieces as hex EWKB, longest first.
+    """
+    import heapq
+    import numpy
+    import shapely
+    lines = shapely.from_wkb(list(geoms))
+    srid = shapely.get_srid(lines[0])
+    merged = shapely.line_merge(shapely.union_all(lines))
+    pieces = []
+    nodes = {}
+    heap = []
+
+    def add(coords):
+        idx = len(pieces)
+        pieces.append(coords)
+        for end in (coords[0], coords[-1]):
+            nodes.setdefault(tuple(end), []).append(idx)
+        heapq.heappush(heap, (numpy.hypot(*numpy.diff(coords, axis=0).T).sum(), idx))
+
+    def remove(idx):
+        coords = pieces[idx]
+        pieces[idx] = None
+        for end in (coords[0], coords[-1]):
+            nodes[tuple(end)].remove(idx)
+        return coords
+
+    for part in shapely.get_parts(merged):
+        add(shapely.get_coordinates(part))
+    alive = len(heap)
+    while alive > 1:
+        length, idx = heap[0]
+        if keep is not None and length > keep:
+            break
+        heapq.heappop(heap)
+        if pieces[idx] is None:
+            continue
+        coords = remove(idx)
+        alive -= 1
+        for node in {tuple(coords[0]), tuple(coords[-1])}:
+            if len(nodes[node]) != 2 or nodes[node][0] == nodes[node][1]:
+                continue
+            first, second = [remove(piece) for piece in list(nodes[node])]
+            if tuple(first[-1]) != node:
+                first = first[::-1]
+            if tuple(second[0]) != node:
+                second = second[::-1]
+            add(numpy.concatenate([first, second[1:]]))
+            alive -= 1
+
+    rest = sorted(((length, idx) for length, idx in heap if pieces[idx] is not None),
+                  reverse=True)
+    return [shapely.to_wkb(shapely.set_srid(shapely.linestrings(pieces[idx]), srid),
+                           hex=True, include_srid=srid != 0) for _, idx in rest]
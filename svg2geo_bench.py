@@ -0,0 +1,147 @@
+#!/usr/bin/python
+"""
+Benchmarks for svg2geo on a 'Harn Atlas Map' SVG.  Compares the
+single pass path tokenizer with the former regex consumption of the
+path data and checks that both yield the same commands and, through
+parse_path, the same vertices.
+"""
+import io
+import re
+import sys
+import math
+import time
+import contextlib
+import argparse
+from xml.etree import ElementTree
+import svg2geo
+
+NUM1 = svg2geo.NUM1
+NUM2 = svg2geo.NUM2
+NUM4 = svg2geo.NUM4
+NUM6 = svg2geo.NUM6
+
+def legacy_tokenize_path(path):
+    """
+    Consume path data the way svg2geo did before the tokenizer, i.e.
+    re.match and re.sub for every command and coordinate group.
+    """
+    while len(path) > 0:
+        path = path.strip(' ')
+        if path[:1] in 'MLVH':
+            num = NUM1 if path[:1] in 'VH' else NUM2
+            match = re.match(rf"{path[:1]}{num}", path)
+            yield path[:1], [float(g) for g in match.groups()]
+            path = re.sub(rf"{path[:1]}{num}", '', path, 1)
+        elif path[:1] == 'Z':
+            yield 'Z', ()
+            path = path[1:]
+        elif path[:1] in 'lvhcsCqt':
+            cmd = path[:1]
+            num = {'l': NUM2, 'v': NUM1, 'h': NUM1, 'c': NUM6, 's': NUM4,
+                   'C': NUM6, 'q': NUM4, 't': NUM2}[cmd]
+            path = path[1:]
+            while match := re.match(rf"{num}", path):
+                yield cmd, [float(g) for g in match.groups()]
+                path = re.sub(rf"{num} ?,?", '', path, 1)
+        else:
+            return
+
+def tokens(tokenizer, path):
+    """List all tokens up to a broken rest, if any."""
+    ret = []
+    try:
+        for cmd, nums in tokenizer(path):
+            ret.append((cmd, list(nums)))
+    except ValueError:
+        pass
+    return ret
+
+class Recorder:
+    """Collect the rings parse_path adds to a layer."""
+    def __init__(self):
+        self.rings = []
+
+    def add(self, props, *rings):
+        """Record all rings of a feature."""
+        self.rings.extend(rings)
+
+def vertices(tokenizer, path, transform):
+    """
+    Parse path with parse_path using tokenizer and return the vertices
+    of all lines.  Styles are left out so every path yields lines.
+    """
+    elem = ElementTree.Element('path', {'d': path, 'transform': transform})
+    recorder = Recorder()
+    parser = svg2geo.tokenize_path
+    svg2geo.tokenize_path = tokenizer
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            svg2geo.parse_path('', elem, recorder, recorder, recorder)
+    finally:
+        svg2geo.tokenize_path = parser
+    return [point for ring in recorder.rings for point in ring]
+
+def deviation(legacy, single):
+    """Largest coordinate difference of two vertex lists, inf if they differ in length."""
+    if len(legacy) != len(single):
+        return math.inf
+    return max((abs(a - b) for p, q in zip(legacy, single) for a, b in zip(p, q)),
+               default=0.0)
+
+def bench(label, tokenizer, paths):
+    """Time tokenizer over all paths."""
+    start = time.perf_counter()
+    count = 0
+    for path in paths:
+        count += len(tokens(tokenizer, path))
+    elapsed = time.perf_counter() - start
+    print(f"{label:10} {elapsed:8.3f}s {count} commands")
+    return elapsed
+
+def main():
+    """Main method."""
+    parser = argparse.ArgumentParser(
+        prog=sys.argv[0],
+        description='Benchmark svg2geo on a Harn SVG.')
+    parser.add_argument('-i', '--input', dest='infile', help='input file name',
+                        required=True)
+    parser.add_argument('-v', '--verbose', action='store_true', help='verbose',
+                        required=False)
+    args = parser.parse_args()
+
+    root = ElementTree.parse(args.infile).getroot()
+    elems = [elem for elem in root.iter() if
+             elem.tag.endswith('path') and 'd' in elem.attrib]
+    paths = [elem.attrib['d'] for elem in elems]
+    print(f"Paths: {len(paths)}, bytes: {sum(len(path) for path in paths)}")
+
+    mismatch = 0
+    for path in paths:
+        if tokens(legacy_tokenize_path, path) != tokens(svg2geo.tokenize_path, path):
+            mismatch += 1
+            if args.verbose:
+                print(f"- mismatch {path[:60]}")
+    print(f"Mismatching paths: {mismatch}")
+
+    # Any frame will do, both tokenizers go through the same transform.
+    svg2geo.SIZEMINX, svg2geo.SIZEMINY, svg2geo.SIZEMAXX, svg2geo.SIZEMAXY = 0, 0, 14, 10
+    mismatch = 0
+    worst = 0.0
+    for elem in elems:
+        path = elem.attrib['d']
+        transform = elem.attrib.get('transform', '-')
+        dev = deviation(vertices(legacy_tokenize_path, path, transform),
+                        vertices(svg2geo.tokenize_path, path, transform))
+        if dev > 1e-9:
+            mismatch += 1
+            if args.verbose:
+                print(f"- vertex mismatch {dev:g} {path[:60]}")
+        worst = max(worst, dev)
+    print(f"Mismatching vertices: {mismatch} paths, max deviation {worst:g}")
+
+    legacy = bench("legacy", legacy_tokenize_path, paths)
+    single = bench("tokenizer", svg2geo.tokenize_path, paths)
+    print(f"Speedup: {legacy / single:.1f}x")
+
+if __name__ == '__main__':
+    main()
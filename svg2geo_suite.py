@@ -0,0 +1,144 @@
+#!/usr/bin/python
+"""
+Benchmark suite for svg2geo.  Generates synthetic SVGs of a few sizes
+with svg2geo_synth, converts them with svg2geo and reports elements
+and vertices per second and the peak memory of the conversion.  The
+features written are hashed and compared with svg2geo_golden.json, so
+a speedup can't silently change geometry.  The smallest and largest
+size are also streamed, to check that --stream keeps memory constant.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import svg2geo_synth
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'svg2geo_golden.json')
+SVG2GEO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'svg2geo.py')
+KINDS = ['polys', 'pts', 'lines']
+DIGITS = 9
+STREAM_GROWTH = 1.5 # largest allowed ratio of the streamed peak memories
+# Run svg2geo and write its peak RSS to the file in argv[1].  VmHWM is
+# taken, since ru_maxrss of a child includes the RSS of its parent at exec.
+PEAK = """
+import sys, runpy
+peak_path = sys.argv[1]
+sys.argv = sys.argv[2:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    with open('/proc/self/status', encoding='utf-8') as status, \\
+         open(peak_path, 'w', encoding='utf-8') as peak_file:
+        peak_file.write([line for line in status if line.startswith('VmHWM:')][0][6:])
+"""
+
+def rounded(coords):
+    """Coordinates rounded to DIGITS, to ignore last bit differences."""
+    if isinstance(coords, (int, float)):
+        return round(coords, DIGITS)
+    return [rounded(coord) for coord in coords]
+
+def feature_hash(path):
+    """Hash of the geometries and properties of all features in path, in order."""
+    digest = hashlib.sha256()
+    with open(path, encoding='utf-8') as json_file:
+        for feature in json.load(json_file)['features']:
+            digest.update(json.dumps([feature['geometry']['type'],
+                                      rounded(feature['geometry']['coordinates']),
+                                      feature['properties']], sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+def run(svg, prefix, extra):
+    """Run svg2geo, return wall time, peak memory in MB and its profile."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', PEAK, f"{prefix}_peak", SVG2GEO,
+                           '-i', svg, '-o', f"{prefix}.json", '-p', f"{prefix}_profile.json"] +
+                          extra, stdout=subprocess.DEVNULL, check=False)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"svg2geo failed on {svg} with {proc.returncode}")
+    with open(f"{prefix}_profile.json", encoding='utf-8') as profile_file:
+        profile = json.load(profile_file)
+    with open(f"{prefix}_peak", encoding='utf-8') as peak_file:
+        # VmHWM is in kB
+        peak = int(peak_file.read().split()[0]) / 1024
+    return elapsed, peak, profile
+
+def stream_check(tmp, sizes):
+    """
+    Convert the smallest and the largest of sizes, already generated in
+    tmp, with --stream.  Return whether the peak memory grew more than
+    STREAM_GROWTH with the size.
+    """
+    small = min(sizes, key=lambda size: svg2geo_synth.SIZES[size])
+    large = max(sizes, key=lambda size: svg2geo_synth.SIZES[size])
+    peaks = [run(os.path.join(tmp, f"{size}.svg"), os.path.join(tmp, f"{size}_stream"),
+                 ['-s'])[1] for size in (small, large)]
+    grows = peaks[1] > peaks[0] * STREAM_GROWTH
+    print(f"stream peak MB {small} {peaks[0]:.1f}, {large} {peaks[1]:.1f}  " +
+          ('GROWS' if grows else 'ok'))
+    return grows
+
+def main():
+    """Main method."""
+    parser = argparse.ArgumentParser(
+        prog=sys.argv[0],
+        description='Benchmark svg2geo on synthetic Harn SVGs.')
+    parser.add_argument('-s', '--sizes', nargs='+', default=list(svg2geo_synth.SIZES),
+                        help='sizes to run', required=False)
+    parser.add_argument('-x', '--extra', default='', help='further svg2geo options, ' +
+                        'e.g. "-j 4"', required=False)
+    parser.add_argument('-u', '--update', action='store_true', help='store the hashes ' +
+                        'as the new golden ones', required=False)
+    parser.add_argument('-v', '--verbose', action='store_true', help='verbose',
+                        required=False)
+    args = parser.parse_args()
+
+    golden = {}
+    if os.path.exists(GOLDEN):
+        with open(GOLDEN, encoding='utf-8') as golden_file:
+            golden = json.load(golden_file)
+    failed = 0
+    print(f"{'size':8} {'elements':>9} {'vertices':>9} {'time':>8} " +
+          f"{'elements/s':>11} {'vertices/s':>11} {'peak MB':>8}  hashes")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            svg = os.path.join(tmp, f"{size}.svg")
+            with open(svg, 'w', encoding='utf-8') as out:
+                svg2geo_synth.generate(out, svg2geo_synth.SIZES[size])
+            prefix = os.path.join(tmp, size)
+            elapsed, peak, profile = run(svg, prefix, args.extra.split())
+            elements = sum(sum(layer['elements'].values()) for layer in profile.values())
+            vertices = sum(layer['vertices'] for layer in profile.values())
+            hashes = {kind: feature_hash(f"{prefix}_{kind}.json") for kind in KINDS}
+            if args.update:
+                golden[size] = hashes
+                state = 'updated'
+            elif size not in golden:
+                state = 'no golden'
+            elif golden[size] == hashes:
+                state = 'ok'
+            else:
+                failed += 1
+                state = 'CHANGED ' + ', '.join(kind for kind in KINDS
+                                               if golden[size].get(kind) != hashes[kind])
+            print(f"{size:8} {elements:9} {vertices:9} {elapsed:8.2f} " +
+                  f"{elements / elapsed:11.0f} {vertices / elapsed:11.0f} {peak:8.1f}  {state}")
+            if args.verbose:
+                for kind in KINDS:
+                    print(f"- {kind} {hashes[kind]}")
+        if len(args.sizes) > 1 and stream_check(tmp, args.sizes):
+            failed += 1
+    if args.update:
+        with open(GOLDEN, 'w', encoding='utf-8') as golden_file:
+            json.dump(golden, golden_file, indent=2)
+            golden_file.write('\n')
+    if failed > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
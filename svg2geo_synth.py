@@ -0,0 +1,172 @@
+#!/usr/bin/python
+"""
+Generate a synthetic 'Harn Atlas Map' like SVG to test and benchmark
+svg2geo with.  It has the A1 grid rect, a style block, symbols placed
+with <use>, the usual layer groups and long curved paths, all drawn
+from a seeded random generator, so the same size and seed always give
+the same file.
+"""
+import sys
+import math
+import random
+import argparse
+
+SIZES = {'small': 200, 'medium': 2000, 'atlas': 20000}
+WIDTH = 1400
+HEIGHT = 1000
+STYLE = """
+      .cls-1 {
+        fill: #36868d;
+      }
+      .cls-2 {
+        fill: #d4effc;
+      }
+      .cls-3, .cls-4 {
+        fill: none;
+        stroke: #000;
+      }
+      .cls-3 {
+        stroke-dasharray: 1 1;
+      }
+      .cls-5 {
+        fill: none;
+        stroke: #36868d;
+      }
+      .cls-6 {
+        fill: #b5d29a;
+      }
+      .cls-7 {
+        fill: none;
+        stroke: #a6793e;
+      }
+"""
+SYMBOLS = ['TOWN', 'CASTLE', 'KEEP', 'MANOR', 'CHAPEL', 'ELEVATION']
+LABELS = ['Tashal', 'Olokand', 'Kiban', 'Heru', 'Qualdris', 'Athelren', 'Zerhun',
+          'Ulmerien', 'Chelebin', 'Kobing', 'Nurisel', 'Gardiren']
+
+def num(value):
+    """Format a coordinate like an Illustrator export does."""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+def curved_path(rnd, closed, segments):
+    """A long path of relative c, s, q and t segments in a random walk."""
+    x_c = rnd.uniform(50, WIDTH - 50)
+    y_c = rnd.uniform(50, HEIGHT - 50)
+    data = [f"M{num(x_c)},{num(y_c)}"]
+    for _ in range(segments):
+        d_x = rnd.uniform(-15, 15)
+        d_y = rnd.uniform(-15, 15)
+        cmd = rnd.choice('cccsqtl')
+        if cmd == 'c':
+            data.append(f"c{num(d_x / 3)},{num(d_y / 3 + rnd.uniform(-3, 3))} " +
+                        f"{num(2 * d_x / 3)},{num(2 * d_y / 3 + rnd.uniform(-3, 3))} " +
+                        f"{num(d_x)},{num(d_y)}")
+        elif cmd == 's':
+            data.append(f"s{num(2 * d_x / 3)},{num(2 * d_y / 3)} {num(d_x)},{num(d_y)}")
+        elif cmd == 'q':
+            data.append(f"q{num(d_x / 2 + rnd.uniform(-3, 3))},{num(d_y / 2)} " +
+                        f"{num(d_x)},{num(d_y)}")
+        elif cmd == 't':
+            data.append(f"t{num(d_x)},{num(d_y)}")
+        else:
+            data.append(f"l{num(d_x)},{num(d_y)}")
+    if closed:
+        data.append('Z')
+    return ''.join(data)
+
+def polygon(rnd, radius):
+    """A star shaped polygon around a random center."""
+    x_c = rnd.uniform(radius, WIDTH - radius)
+    y_c = rnd.uniform(radius, HEIGHT - radius)
+    count = rnd.randint(5, 12)
+    points = []
+    for idx in range(count):
+        angle = 2 * math.pi * idx / count
+        dist = rnd.uniform(radius / 2, radius)
+        points.append(f"{num(x_c + dist * math.cos(angle))}," +
+                      f"{num(y_c + dist * math.sin(angle))}")
+    return ' '.join(points)
+
+def generate(out, count, seed=1):
+    """Write an SVG with about count elements to the file out."""
+    rnd = random.Random(seed)
+    out.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    out.write('<svg xmlns="http://www.w3.org/2000/svg" ' +
+              'xmlns:xlink="http://www.w3.org/1999/xlink" ' +
+              f'viewBox="0 0 {WIDTH} {HEIGHT}">\n')
+    out.write(f"<defs>\n<style>{STYLE}</style>\n")
+    for symbol in SYMBOLS:
+        out.write(f'<symbol id="{symbol}" data-name="{symbol.title()}" ' +
+                  'viewBox="0 0 4 4"><circle cx="2" cy="2" r="2"/></symbol>\n')
+    out.write("</defs>\n")
+    out.write('<g id="MAP_GRIDS" data-name="MAP_GRIDS">\n')
+    for row in range(10):
+        for col in range(14):
+            out.write(f'<rect id="{chr(65 + col)}{row + 1}" x="{col * 100}" ' +
+                      f'y="{row * 100}" width="100" height="100"/>\n')
+    out.write("</g>\n")
+
+    share = max(count // 10, 1)
+    out.write('<g id="COASTLINE" data-name="COASTLINE">\n')
+    for _ in range(max(share // 10, 1)):
+        out.write(f'<path class="cls-3" d="{curved_path(rnd, True, 400)}"/>\n')
+    out.write("</g>\n")
+    out.write('<g id="CONTOURS" data-name="CONTOURS">\n')
+    for level in range(5):
+        out.write(f'<g id="CONTOURS_{level}" data-name="CONTOURS_{level}">\n')
+        for _ in range(share // 2):
+            out.write(f'<path class="cls-4" d="{curved_path(rnd, rnd.random() < .5, 60)}"/>\n')
+        out.write("</g>\n")
+    out.write("</g>\n")
+    out.write('<g id="RIVERS" data-name="RIVERS">\n')
+    for _ in range(share):
+        out.write(f'<path class="cls-5" d="{curved_path(rnd, False, 20)}"/>\n')
+    for _ in range(max(share // 10, 1)):
+        out.write(f'<path class="cls-1" d="{curved_path(rnd, True, 30)}"/>\n')
+    out.write("</g>\n")
+    out.write('<g id="LAKES" data-name="LAKES">\n')
+    for _ in range(max(share // 2, 1)):
+        out.write(f'<polygon class="cls-2" points="{polygon(rnd, 8)}"/>\n')
+    out.write("</g>\n")
+    out.write('<g id="ROADS" data-name="ROADS">\n')
+    for _ in range(share):
+        points = ' '.join(f"{num(rnd.uniform(0, WIDTH))},{num(rnd.uniform(0, HEIGHT))}"
+                          for _ in range(rnd.randint(2, 8)))
+        out.write(f'<polyline class="cls-{rnd.choice("37")}" points="{points}"/>\n')
+    out.write("</g>\n")
+    out.write('<g id="VEGETATION" data-name="VEGETATION">\n')
+    for _ in range(share):
+        out.write(f'<polygon class="cls-6" points="{polygon(rnd, 20)}"/>\n')
+    out.write("</g>\n")
+    out.write('<g id="SETTLEMENTS" data-name="SETTLEMENTS">\n')
+    for _ in range(share):
+        out.write(f'<use xlink:href="#{rnd.choice(SYMBOLS)}" width="4" height="4" ' +
+                  f'transform="translate({num(rnd.uniform(0, WIDTH))} ' +
+                  f'{num(rnd.uniform(0, HEIGHT))})"/>\n')
+    out.write("</g>\n")
+    out.write('<g id="LABELS" data-name="LABELS">\n')
+    for _ in range(share):
+        out.write(f'<text transform="translate({num(rnd.uniform(0, WIDTH))} ' +
+                  f'{num(rnd.uniform(0, HEIGHT))}) rotate({rnd.randint(-30, 30)})" ' +
+                  f'font-size="{rnd.choice([6, 8, 10])}">{rnd.choice(LABELS)}</text>\n')
+    out.write("</g>\n")
+    out.write("</svg>\n")
+
+def main():
+    """Main method."""
+    parser = argparse.ArgumentParser(
+        prog=sys.argv[0],
+        description='Generate a synthetic Harn SVG.')
+    parser.add_argument('-o', '--output', dest='outfile', help='output file name',
+                        required=True)
+    parser.add_argument('-s', '--size', default='small', help='number of elements or ' +
+                        f"one of {', '.join(SIZES)}", required=False)
+    parser.add_argument('--seed', type=int, default=1, help='random seed', required=False)
+    args = parser.parse_args()
+
+    count = SIZES[args.size] if args.size in SIZES else int(args.size)
+    with open(args.outfile, 'w', encoding='utf-8') as out:
+        generate(out, count, args.seed)
+
+if __name__ == '__main__':
+    main()